@@ -0,0 +1,331 @@
+# backend/backfill_embeddings.py
+#
+# Bulk re-embed every target collection into a new, versioned generation
+# and (optionally) switch live services to it.
+#
+#   python backfill_embeddings.py                         # current EMBED_MODEL, all collections
+#   python backfill_embeddings.py --model <name> --workers 8
+#   python backfill_embeddings.py --generation <name>     # resume an interrupted run
+#
+# Without --generation every run starts a new generation named
+# <model>-<YYYYMMDD-HHMMSS>; resuming only happens when a name is given.
+#
+# Documents are streamed from Mongo in _id order, turned into text with
+# build_text(), and encoded across a sentence-transformers process pool.
+# Each batch is saved as its own part file before the checkpoint moves
+# forward, so a killed run resumes from the last saved batch.
+import os
+import sys
+import re
+import time
+import queue
+import argparse
+import threading
+import warnings
+import uuid
+from datetime import datetime
+
+warnings.filterwarnings("ignore", category=UserWarning)
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+import numpy as np
+from bson import json_util, Binary, Decimal128, Int64, MaxKey, MinKey, Regex, Timestamp
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+
+sys.path.append(os.path.dirname(__file__))
+
+from doc_text import TARGET_COLLECTIONS, projection_for, build_text
+import embedding_store as store
+
+
+# ----------------------------------------------------
+# CONFIG
+# ----------------------------------------------------
+MONGO_URI = os.getenv("MONGO_URI")   # required, no default credential
+DB_NAME = os.getenv("MONGO_DB", "prescripta")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Re-embed MongoDB collections into a new index generation.")
+    p.add_argument("--model", default=EMBED_MODEL)
+    p.add_argument("--collections", nargs="+", default=TARGET_COLLECTIONS)
+    p.add_argument("--generation", help="resume (or name) this generation; default: new <model>-<timestamp>")
+    p.add_argument("--out-dir", default=store.EMBEDDINGS_DIR)
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                   help="encoder processes when running on CPU")
+    p.add_argument("--devices", nargs="+", help="explicit devices, e.g. cuda:0 cuda:1 (overrides --workers)")
+    p.add_argument("--read-batch", type=int, default=10000, help="documents per part / checkpoint")
+    p.add_argument("--encode-batch", type=int, default=64, help="sentences per model forward pass")
+    p.add_argument("--no-activate", action="store_true", help="build the generation but keep CURRENT as is")
+    return p.parse_args()
+
+
+def default_generation(model):
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", model.split("/")[-1]).strip("-").lower()
+    return f"{slug}-{datetime.now():%Y%m%d-%H%M%S}"
+
+
+# ----------------------------------------------------
+# CHECKPOINT
+# ----------------------------------------------------
+def encode_id(_id):
+    # extended JSON keeps the BSON type (int stays int, ObjectId stays ObjectId)
+    return json_util.dumps(_id)
+
+
+def decode_id(s):
+    return json_util.loads(s)
+
+
+# _id types in MongoDB sort order, as $type aliases (_id cannot be an array)
+BSON_TYPE_ORDER = [
+    ["minKey"],
+    ["null"],
+    ["int", "long", "double", "decimal"],
+    ["string", "symbol"],
+    ["object"],
+    ["binData"],
+    ["objectId"],
+    ["bool"],
+    ["date"],
+    ["timestamp"],
+    ["regex"],
+    ["maxKey"],
+]
+
+
+def bson_bracket(value):
+    """Index of value's type in BSON_TYPE_ORDER, or None if unknown."""
+    if isinstance(value, MinKey):
+        return 0
+    if value is None:
+        return 1
+    if isinstance(value, bool):   # before int: bool is an int subclass
+        return 7
+    if isinstance(value, (int, float, Int64, Decimal128)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, (bytes, Binary, uuid.UUID)):
+        return 5
+    if isinstance(value, ObjectId):
+        return 6
+    if isinstance(value, datetime):
+        return 8
+    if isinstance(value, Timestamp):
+        return 9
+    if isinstance(value, (Regex, re.Pattern)):
+        return 10
+    if isinstance(value, MaxKey):
+        return 11
+    return None
+
+
+def resume_filter(last_id):
+    """
+    Match every _id after last_id in sort order. $gt only compares within
+    one BSON type, so _ids of the types that sort later are matched too.
+    """
+    bracket = bson_bracket(last_id)
+    if bracket is None:
+        raise ValueError(f"cannot resume after an _id of type {type(last_id).__name__}")
+
+    later = [t for types in BSON_TYPE_ORDER[bracket + 1:] for t in types]
+    if not later:
+        return {"_id": {"$gt": last_id}}
+    return {"$or": [{"_id": {"$gt": last_id}}, {"_id": {"$type": later}}]}
+
+
+def load_checkpoint(gen_dir, collections):
+    ckpt = store.read_json(os.path.join(gen_dir, "checkpoint.json"), {})
+    for c in collections:
+        ckpt.setdefault(c, {"last_id": None, "parts": 0, "docs": 0, "done": False})
+    return ckpt
+
+
+# ----------------------------------------------------
+# READER (runs ahead of the encoder in a thread)
+# ----------------------------------------------------
+def read_batches(col, collection, last_id, batch_size):
+    query = resume_filter(decode_id(last_id)) if last_id else {}
+    cursor = (
+        col.find(query, projection_for(collection), batch_size=min(batch_size, 5000))
+        .sort("_id", 1)
+    )
+
+    ids, texts, last = [], [], None
+    for d in cursor:
+        ids.append(str(d["_id"]))
+        texts.append(build_text(collection, d))
+        last = d["_id"]
+        if len(ids) >= batch_size:
+            yield ids, texts, last
+            ids, texts = [], []
+    if ids:
+        yield ids, texts, last
+
+
+def prefetch(gen, depth=2):
+    q = queue.Queue(maxsize=depth)
+    done = object()
+
+    def worker():
+        try:
+            for item in gen:
+                q.put(item)
+        except Exception as e:
+            q.put(e)
+        q.put(done)
+
+    threading.Thread(target=worker, daemon=True).start()
+    while True:
+        item = q.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+# ----------------------------------------------------
+# BACKFILL
+# ----------------------------------------------------
+def encode(model, pool, texts, batch_size):
+    v = model.encode_multi_process(texts, pool, batch_size=batch_size).astype("float32")
+    v /= np.linalg.norm(v, axis=1, keepdims=True) + 1e-12
+    return v
+
+
+def backfill(args, db, generation):
+    from sentence_transformers import SentenceTransformer
+
+    gen_dir = store.generation_dir(generation, args.out_dir)
+    os.makedirs(gen_dir, exist_ok=True)
+
+    model = SentenceTransformer(args.model)
+    dim = model.get_sentence_embedding_dimension()
+
+    manifest = store.read_json(os.path.join(gen_dir, "manifest.json"))
+    if manifest and manifest["model"] != args.model:
+        raise SystemExit(f"generation {generation} was built with {manifest['model']}, not {args.model}")
+    store.write_json_atomic(os.path.join(gen_dir, "manifest.json"), {
+        "model": args.model,
+        "dim": dim,
+        "collections": args.collections,
+        "created": (manifest or {}).get("created", datetime.now().isoformat()),
+    })
+
+    ckpt = load_checkpoint(gen_dir, args.collections)
+    devices = args.devices or ["cpu"] * max(1, args.workers)
+
+    # Pool workers import torch after this, so they read these limits.
+    # Split the cores between CPU workers instead of every worker using all of them.
+    cpu_workers = devices.count("cpu")
+    if cpu_workers:
+        threads = str(max(1, (os.cpu_count() or 1) // cpu_workers))
+        os.environ["OMP_NUM_THREADS"] = threads
+        os.environ["MKL_NUM_THREADS"] = threads
+
+    pool = model.start_multi_process_pool(target_devices=devices)
+    print(f"Encoder pool: {len(devices)} process(es) on {', '.join(sorted(set(devices)))}")
+
+    started = time.time()
+    total = 0
+    try:
+        for c in args.collections:
+            state = ckpt[c]
+            if state["done"]:
+                print(f"[{c}] already done ({state['docs']} docs), skipping")
+                continue
+
+            if state["last_id"]:
+                try:
+                    resume_filter(decode_id(state["last_id"]))
+                except ValueError as e:
+                    raise SystemExit(f"[{c}] {e}; start a new generation instead")
+
+            print(f"[{c}] starting at part {state['parts']} ({state['docs']} docs already embedded)")
+            batches = read_batches(db[c], c, state["last_id"], args.read_batch)
+
+            for ids, texts, last in prefetch(batches):
+                t0 = time.time()
+                vectors = encode(model, pool, texts, args.encode_batch)
+                store.write_part(store.part_path(generation, c, state["parts"], args.out_dir), ids, vectors)
+
+                # checkpoint only after the part is safely on disk
+                state["parts"] += 1
+                state["docs"] += len(ids)
+                state["last_id"] = encode_id(last)
+                store.write_json_atomic(os.path.join(gen_dir, "checkpoint.json"), ckpt)
+
+                total += len(ids)
+                elapsed = time.time() - started
+                print(f"[{c}] +{len(ids)} docs  batch {len(ids) / (time.time() - t0):.0f} docs/s  "
+                      f"overall {total / elapsed:.0f} docs/s  ({total} this run)")
+
+            state["done"] = True
+            store.write_json_atomic(os.path.join(gen_dir, "checkpoint.json"), ckpt)
+    finally:
+        model.stop_multi_process_pool(pool)
+
+    elapsed = time.time() - started
+    if total:
+        print(f"\nEmbedded {total} docs in {elapsed:.1f}s ({total / elapsed:.0f} docs/s)")
+    return ckpt, dim
+
+
+def build_index(args, generation, ckpt, dim):
+    import faiss
+
+    gen_dir = store.generation_dir(generation, args.out_dir)
+    index = faiss.IndexFlatIP(dim)
+    ids = []
+
+    for c in args.collections:
+        for part in range(ckpt[c]["parts"]):
+            data = np.load(store.part_path(generation, c, part, args.out_dir))
+            index.add(data["embeddings"])
+            ids.extend([c, str(doc_id)] for doc_id in data["ids"])
+
+    tmp = os.path.join(gen_dir, "index.faiss.tmp")
+    faiss.write_index(index, tmp)
+    store.write_json_atomic(os.path.join(gen_dir, "ids.json"), ids)
+    os.replace(tmp, os.path.join(gen_dir, "index.faiss"))
+
+    manifest = store.read_json(os.path.join(gen_dir, "manifest.json"))
+    manifest["count"] = index.ntotal
+    manifest["completed"] = datetime.now().isoformat()
+    store.write_json_atomic(os.path.join(gen_dir, "manifest.json"), manifest)
+    print(f"✅ Indexed {index.ntotal} vectors into {gen_dir}")
+
+
+# ----------------------------------------------------
+# MAIN
+# ----------------------------------------------------
+def main():
+    args = parse_args()
+    if not MONGO_URI:
+        raise SystemExit("MONGO_URI is not set")
+
+    generation = args.generation or default_generation(args.model)
+    if args.generation and os.path.exists(store.generation_dir(generation, args.out_dir)):
+        print(f"Resuming generation {generation}")
+    print(f"Generation: {generation}  model: {args.model}")
+
+    db = MongoClient(MONGO_URI)[DB_NAME]
+    ckpt, dim = backfill(args, db, generation)
+    build_index(args, generation, ckpt, dim)
+
+    if args.no_activate:
+        print(f"Generation {generation} is ready (not activated)")
+    else:
+        store.activate(generation, args.out_dir)
+        print(f"▶ Live services now use generation {generation}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# backend/doc_text.py
+# Shared by pathway_connector.py and backfill_embeddings.py so both
+# embed exactly the same text for a document.
+
+TARGET_COLLECTIONS = [
+    "doctors",
+    "hospitals",
+    "appointments",
+    "insurances",
+    "medicalreports",
+    "reviews",
+    "symptomhistories",
+    "users",
+]
+
+
+# ----------------------------------------------------
+# PROJECTIONS (only the fields build_text() reads)
+# ----------------------------------------------------
+TEXT_FIELDS = {
+    "doctors": ["name", "speciality", "about", "languagesKnown", "acceptedInsurances"],
+    "hospitals": ["name", "location", "services"],
+    "appointments": ["doctorName", "date", "time"],
+    "insurances": ["provider", "coverage"],
+    "medicalreports": ["patientName", "type", "results"],
+    "reviews": ["user", "doctor", "content"],
+    "symptomhistories": ["symptoms", "diagnosis"],
+    "users": ["name", "email", "role"],
+}
+
+def projection_for(collection):
+    fields = TEXT_FIELDS.get(collection)
+    if fields is None:
+        return None   # unknown collection: build_text() falls back to the whole document
+    return {f: 1 for f in fields}
+
+
+# ----------------------------------------------------
+# TEXT BUILDER
+# ----------------------------------------------------
+def build_text(collection, doc):
+
+    if collection == "doctors":
+        return " ".join(filter(None, [
+            f"Doctor: {doc.get('name','')}",
+            f"Speciality: {doc.get('speciality','')}",
+            f"About: {doc.get('about','')}",
+            "Languages: " + ", ".join(doc.get("languagesKnown", [])),
+            "Insurances: " + ", ".join(doc.get("acceptedInsurances", [])),
+        ]))
+
+    if collection == "hospitals":
+        return f"Hospital: {doc.get('name','')} {doc.get('location','')} Services: {doc.get('services','')}"
+
+    if collection == "appointments":
+        return f"Appointment with {doc.get('doctorName','')} on {doc.get('date','')} at {doc.get('time','')}"
+
+    if collection == "insurances":
+        return f"Insurance: {doc.get('provider','')} coverage: {doc.get('coverage','')}"
+
+    if collection == "medicalreports":
+        return f"Medical report for {doc.get('patientName','')} - {doc.get('type','')} Results: {doc.get('results','')}"
+
+    if collection == "reviews":
+        return f"Review by {doc.get('user','')} for {doc.get('doctor','')}: {doc.get('content','')}"
+
+    if collection == "symptomhistories":
+        return f"Symptoms: {doc.get('symptoms','')} Diagnosis: {doc.get('diagnosis','')}"
+
+    if collection == "users":
+        return f"User {doc.get('name','')} email {doc.get('email','')} role {doc.get('role','')}"
+
+    return str(doc)
@@ -0,0 +1,166 @@
+# backend/embedding_store.py
+#
+# Versioned embedding snapshots written by backfill_embeddings.py.
+#
+#   EMBEDDINGS_DIR/
+#     CURRENT                  <- name of the live generation
+#     <generation>/
+#       manifest.json          <- model, dim, collections, doc count
+#       checkpoint.json        <- per-collection resume state
+#       parts/<collection>-00000.npz
+#       index.faiss, ids.json  <- written once all parts are done
+#
+# Services read CURRENT through LiveIndex, which loads a new generation in
+# the background and swaps it in with a single assignment, so queries keep
+# being served from the old generation until the new one is ready.
+import os
+import json
+import threading
+import time
+
+import numpy as np
+
+EMBEDDINGS_DIR = os.getenv(
+    "EMBEDDINGS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "embeddings"),
+)
+
+
+# ----------------------------------------------------
+# FILE HELPERS
+# ----------------------------------------------------
+def write_json_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def generation_dir(generation, base_dir=EMBEDDINGS_DIR):
+    return os.path.join(base_dir, generation)
+
+
+def part_path(generation, collection, part, base_dir=EMBEDDINGS_DIR):
+    return os.path.join(generation_dir(generation, base_dir), "parts", f"{collection}-{part:05d}.npz")
+
+
+def write_part(path, ids, embeddings):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, ids=np.array(ids), embeddings=embeddings.astype("float32"))
+    os.replace(tmp, path)
+
+
+# ----------------------------------------------------
+# CURRENT POINTER
+# ----------------------------------------------------
+def current_generation(base_dir=EMBEDDINGS_DIR):
+    path = os.path.join(base_dir, "CURRENT")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read().strip() or None
+
+
+def activate(generation, base_dir=EMBEDDINGS_DIR):
+    """Point CURRENT at a finished generation (atomic rename)."""
+    gen_dir = generation_dir(generation, base_dir)
+    if not os.path.exists(os.path.join(gen_dir, "index.faiss")):
+        raise ValueError(f"generation {generation} has no index.faiss")
+
+    tmp = os.path.join(base_dir, "CURRENT.tmp")
+    with open(tmp, "w") as f:
+        f.write(generation)
+    os.replace(tmp, os.path.join(base_dir, "CURRENT"))
+
+
+def load_generation(generation, base_dir=EMBEDDINGS_DIR):
+    import faiss
+
+    gen_dir = generation_dir(generation, base_dir)
+    manifest = read_json(os.path.join(gen_dir, "manifest.json"))
+    index = faiss.read_index(os.path.join(gen_dir, "index.faiss"))
+    ids = read_json(os.path.join(gen_dir, "ids.json"), [])
+    return manifest, index, ids
+
+
+# ----------------------------------------------------
+# LIVE INDEX (hot swap)
+# ----------------------------------------------------
+class LiveIndex:
+    def __init__(self, base_dir=EMBEDDINGS_DIR, poll_seconds=30, models=None):
+        self.base_dir = base_dir
+        self.poll_seconds = poll_seconds
+        self.state = None   # (generation, model, index, ids)
+        self._models = dict(models or {})   # already-loaded models by name, reused if they match
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._safe_refresh()
+            self._thread = threading.Thread(target=self._watch, daemon=True)
+            self._thread.start()
+        return self
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            self._safe_refresh()
+
+    def _safe_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"[LiveIndex] reload failed, keeping current generation: {e}")
+
+    def refresh(self):
+        generation = current_generation(self.base_dir)
+        if not generation or (self.state and self.state[0] == generation):
+            return
+
+        manifest, index, ids = load_generation(generation, self.base_dir)
+        model_name = manifest["model"]
+        if model_name not in self._models:
+            from sentence_transformers import SentenceTransformer
+            self._models = {model_name: SentenceTransformer(model_name)}
+
+        # single assignment -> readers see either the old or the new generation
+        self.state = (generation, self._models[model_name], index, ids)
+        print(f"[LiveIndex] serving generation {generation} ({index.ntotal} vectors)")
+
+    def search(self, text, k=5, collections=None):
+        """
+        Returns [(collection, doc_id, score), ...] or [] if nothing is active.
+        `collections` limits hits to those collections (searching wider
+        until k hits are found or the whole index was searched).
+        """
+        state = self.state
+        if state is None:
+            return []
+
+        _, model, index, ids = state
+        if index.ntotal == 0:
+            return []
+
+        q = model.encode([text], convert_to_numpy=True).astype("float32")
+        q /= np.linalg.norm(q, axis=1, keepdims=True) + 1e-12
+
+        fetch = k if collections is None else k * 10
+        while True:
+            fetch = min(fetch, index.ntotal)
+            D, I = index.search(q, fetch)
+            hits = [
+                (ids[i][0], ids[i][1], float(score))
+                for score, i in zip(D[0], I[0])
+                if 0 <= i < len(ids) and (collections is None or ids[i][0] in collections)
+            ]
+            if len(hits) >= k or fetch >= index.ntotal:
+                return hits[:k]
+            fetch *= 4
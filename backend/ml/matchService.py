@@ -16,7 +16,10 @@ import pathway as pw
 
 # -------------------- CONFIG --------------------
 warnings.filterwarnings("ignore")
-sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from doc_text import build_text
+from embedding_store import current_generation, generation_dir, read_json
 
 # Flask + CORS
 app = Flask(__name__)
@@ -30,17 +33,15 @@ db = client[DB_NAME]
 doctor_collection = db["doctors"]
 
 # Sentence Transformer
-model = SentenceTransformer("all-MiniLM-L6-v2")
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+model = SentenceTransformer(EMBED_MODEL_NAME)
 EMBED_DIM = model.get_sentence_embedding_dimension()
 
-# FAISS index
-index = faiss.IndexFlatIP(EMBED_DIM)
-doctor_ids = []
-
-# Speciality embeddings
-speciality_index = None
-specialities = []
-speciality_embeddings = None
+# Search state, swapped as one tuple so /match never sees a half-built index:
+# (generation, model, doctor index, doctor_ids, speciality_index, specialities)
+search_state = None
+models = {}   # only the active generation's model is kept
+GENERATION_POLL = 30  # seconds
 
 # Pathway
 TARGET_COLLECTIONS = [
@@ -51,38 +52,88 @@ OUTPUT_PATH = "./pathway_live_docs.jsonl"
 POLL_INTERVAL = 5000  # ms
 
 # -------------------- FUNCTIONS --------------------
-def build_index():
-    global index, doctor_ids, speciality_index, specialities, speciality_embeddings
-    index = faiss.IndexFlatIP(EMBED_DIM)
-    doctor_ids = []
+def doctor_text(d):
+    return " ".join(filter(None, [
+        f"Speciality: {d.get('speciality','')}",
+        f"About: {d.get('about','')}",
+        "Languages: " + ", ".join(d.get("languagesKnown", [])),
+        "Insurances: " + ", ".join(d.get("acceptedInsurances", [])),
+        "Hospitals: " + ", ".join([h.get("name","") for h in d.get("hospitals", [])])
+    ]))
+
+def get_model(name):
+    global models
+    if name not in models:
+        # replace instead of add, so older generations' models can be freed
+        models = {name: SentenceTransformer(name)}
+    return models[name]
+
+def build_index(generation=None):
+    """
+    Build the doctor + speciality indexes from Mongo.
+    With a generation (from backfill_embeddings.py) everything is encoded
+    with that generation's model, so queries and vectors always match;
+    the doctor text stays doctor_text(). Without one, `model` is used.
+    """
+    global search_state
+
+    if generation:
+        manifest = read_json(os.path.join(generation_dir(generation), "manifest.json"))
+        if not manifest:
+            raise ValueError(f"generation {generation} has no manifest.json")
+        m = get_model(manifest["model"])
+    else:
+        m = model
+
+    dim = m.get_sentence_embedding_dimension()
+    new_index = faiss.IndexFlatIP(dim)
+    new_ids = []
 
     docs = list(doctor_collection.find({}))
     texts = []
     for d in docs:
-        text = " ".join(filter(None, [
-            f"Speciality: {d.get('speciality','')}",
-            f"About: {d.get('about','')}",
-            "Languages: " + ", ".join(d.get("languagesKnown", [])),
-            "Insurances: " + ", ".join(d.get("acceptedInsurances", [])),
-            "Hospitals: " + ", ".join([h.get("name","") for h in d.get("hospitals", [])])
-        ]))
-        texts.append(text)
-        doctor_ids.append(str(d["_id"]))
+        texts.append(doctor_text(d))
+        new_ids.append(str(d["_id"]))
 
     if texts:
-        embeddings = model.encode(texts, convert_to_numpy=True, show_progress_bar=True)
+        embeddings = m.encode(texts, convert_to_numpy=True, show_progress_bar=True)
         faiss.normalize_L2(embeddings)
-        index.add(embeddings)
-        print(f"✅ Indexed {len(texts)} doctors")
+        new_index.add(embeddings)
+        print(f"✅ Indexed {len(texts)} doctors (generation {generation})")
 
     # Specialities
-    specialities = list(set([d.get("speciality","") for d in docs if d.get("speciality")]))
-    if specialities:
-        speciality_embeddings = model.encode(specialities, convert_to_numpy=True)
+    new_specialities = list(set([d.get("speciality","") for d in docs if d.get("speciality")]))
+    new_speciality_index = None
+    if new_specialities:
+        speciality_embeddings = m.encode(new_specialities, convert_to_numpy=True)
         faiss.normalize_L2(speciality_embeddings)
-        speciality_index = faiss.IndexFlatIP(EMBED_DIM)
-        speciality_index.add(speciality_embeddings)
-        print(f"✅ Indexed {len(specialities)} specialities")
+        new_speciality_index = faiss.IndexFlatIP(dim)
+        new_speciality_index.add(speciality_embeddings)
+        print(f"✅ Indexed {len(new_specialities)} specialities")
+
+    search_state = (generation, m, new_index, new_ids, new_speciality_index, new_specialities)
+
+def watch_generation():
+    """
+    Build the index, then rebuild it whenever embeddings/CURRENT changes.
+    Failures are logged and retried on the next poll; the thread never dies.
+    """
+    while True:
+        generation = current_generation()
+        active = search_state[0] if search_state else None
+
+        if search_state is None or (generation and generation != active):
+            try:
+                build_index(generation)
+            except Exception as e:
+                print(f"⚠️ Could not build index for generation {generation}: {e}")
+                if search_state is None and generation:
+                    try:
+                        build_index()
+                    except Exception as e:
+                        print(f"⚠️ Could not build fallback index, retrying in {GENERATION_POLL}s: {e}")
+
+        time.sleep(GENERATION_POLL)
 
 # -------------------- PATHWAY CONNECTOR --------------------
 class DocSchema(pw.Schema):
@@ -94,31 +145,6 @@ class DocSchema(pw.Schema):
 def doc_hash(d):
     return hashlib.md5(json.dumps(d, sort_keys=True).encode()).hexdigest()
 
-def build_text(collection, doc):
-    if collection == "doctors":
-        return " ".join(filter(None, [
-            f"Doctor: {doc.get('name','')}",
-            f"Speciality: {doc.get('speciality','')}",
-            f"About: {doc.get('about','')}",
-            "Languages: " + ", ".join(doc.get("languagesKnown", [])),
-            "Insurances: " + ", ".join(doc.get("acceptedInsurances", [])),
-        ]))
-    if collection == "hospitals":
-        return f"Hospital: {doc.get('name','')} {doc.get('location','')} Services: {doc.get('services','')}"
-    if collection == "appointments":
-        return f"Appointment with {doc.get('doctorName','')} on {doc.get('date','')} at {doc.get('time','')}"
-    if collection == "insurances":
-        return f"Insurance: {doc.get('provider','')} coverage: {doc.get('coverage','')}"
-    if collection == "medicalreports":
-        return f"Medical report for {doc.get('patientName','')} - {doc.get('type','')} Results: {doc.get('results','')}"
-    if collection == "reviews":
-        return f"Review by {doc.get('user','')} for {doc.get('doctor','')}: {doc.get('content','')}"
-    if collection == "symptomhistories":
-        return f"Symptoms: {doc.get('symptoms','')} Diagnosis: {doc.get('diagnosis','')}"
-    if collection == "users":
-        return f"User {doc.get('name','')} email {doc.get('email','')} role {doc.get('role','')}"
-    return str(doc)
-
 def fetch_rows(collection_name):
     col = db[collection_name]
     rows = []
@@ -196,7 +222,10 @@ def match():
     top_k = body.get("top_k",5)
     if not query:
         return jsonify({"error":"query is required"}),400
-    query_embedding = model.encode([query], convert_to_numpy=True)
+    if search_state is None:
+        return jsonify({"matches":[]})
+    _, m, index, doctor_ids, speciality_index, specialities = search_state
+    query_embedding = m.encode([query], convert_to_numpy=True)
     faiss.normalize_L2(query_embedding)
     D,I = index.search(query_embedding, top_k)
     speciality_boost = None
@@ -231,8 +260,8 @@ def match():
 
 # -------------------- MAIN --------------------
 if __name__=="__main__":
-    # 1️⃣ Start FAISS index in background
-    threading.Thread(target=build_index, daemon=True).start()
+    # 1️⃣ Start FAISS index in background (follows embeddings/CURRENT)
+    threading.Thread(target=watch_generation, daemon=True).start()
     
     # 2️⃣ Start Pathway watcher in background
     threading.Thread(target=run_pathway, daemon=True).start()
@@ -0,0 +1,58 @@
+# backend/mongo_shards.py
+# _id range sharding used by pathway_connector.py. Kept free of Pathway
+# so the split logic can be tested on its own.
+from bson.objectid import ObjectId
+
+OBJECT_ID = {"$type": "objectId"}
+
+
+def split_points(col, shards):
+    """
+    Pick shards - 1 ObjectId cut points so each range holds about the same
+    number of documents: the (i * count / shards)-th _id in index order.
+    Deterministic for a given data set, so every process gets the same cuts.
+    """
+    count = col.count_documents({"_id": OBJECT_ID})
+    if count == 0:
+        # no ObjectIds: keep the shard count fixed with empty ranges
+        return [ObjectId("0" * 24)] * (shards - 1)
+
+    cuts = []
+    for i in range(1, shards):
+        cursor = (
+            col.find({"_id": OBJECT_ID}, {"_id": 1})
+            .sort("_id", 1)
+            .skip(i * count // shards)
+            .limit(1)
+        )
+        d = next(iter(cursor), None)
+        cuts.append(d["_id"] if d else cuts[-1] if cuts else ObjectId("0" * 24))
+    return cuts
+
+
+def range_filters(cuts):
+    """
+    One filter per half-open ObjectId range [lo, hi) between the cuts, plus
+    one filter for every other _id type ($gte/$lt only match values of the
+    bound's BSON type, so those would otherwise be skipped).
+    """
+    bounds = [None, *cuts, None]
+
+    filters = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        cond = dict(OBJECT_ID)
+        if lo is not None:
+            cond["$gte"] = lo
+        if hi is not None:
+            cond["$lt"] = hi
+        filters.append({"_id": cond})
+
+    filters.append({"_id": {"$not": OBJECT_ID}})
+    return filters
+
+
+def shard_filters(col, shards):
+    """Split a collection into shards + 1 Mongo filters balanced by count."""
+    if shards < 2:
+        return [{}]
+    return range_filters(split_points(col, shards))
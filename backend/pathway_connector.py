@@ -3,6 +3,19 @@ import os
 import warnings
 import json
 import hashlib
+import time
+
+# Pathway reads its worker-thread count from the environment when the
+# engine starts. Default to one worker per core; for several processes
+# launch with `pathway spawn -n <processes> -t <threads> python pathway_connector.py`.
+os.environ.setdefault("PATHWAY_THREADS", str(os.cpu_count() or 1))
+
+# Each Pathway worker runs the embed UDF, so give torch an equal share of
+# the cores per worker instead of letting every worker use all of them.
+PATHWAY_WORKERS = int(os.environ["PATHWAY_THREADS"]) * int(os.getenv("PATHWAY_PROCESSES", "1"))
+TORCH_THREADS = max(1, (os.cpu_count() or 1) // PATHWAY_WORKERS)
+os.environ.setdefault("OMP_NUM_THREADS", str(TORCH_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(TORCH_THREADS))
 
 # CLEAN WARNINGS
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -10,8 +23,12 @@ warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 import pathway as pw
 from pymongo import MongoClient
+import torch
 from sentence_transformers import SentenceTransformer
 
+from doc_text import TARGET_COLLECTIONS, projection_for, build_text
+from mongo_shards import shard_filters
+
 
 # ----------------------------------------------------
 # CONFIG
@@ -22,114 +39,104 @@ MONGO_URI = os.getenv(
 )
 DB_NAME = os.getenv("MONGO_DB", "prescripta")
 
-TARGET_COLLECTIONS = [
-    "doctors",
-    "hospitals",
-    "appointments",
-    "insurances",
-    "medicalreports",
-    "reviews",
-    "symptomhistories",
-    "users",
-]
-
 EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", "5")) * 1000  # ms
 OUTPUT_PATH = "./pathway_live_docs.jsonl"
 
-mongo_client = MongoClient(MONGO_URI)
-db = mongo_client[DB_NAME]
+# Reader tuning
+MONGO_POOL_SIZE = int(os.getenv("MONGO_POOL_SIZE", "0"))   # raised to at least one connection per source
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", "1000"))
+SHARD_MIN_DOCS = int(os.getenv("SHARD_MIN_DOCS", "50000"))   # collections above this are split by _id
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", str(os.cpu_count() or 1)))
+# Optional fixed list of collections to shard. Set it under `pathway spawn`
+# so every process builds the same graph regardless of document counts.
+SHARDED_COLLECTIONS = [c for c in os.getenv("SHARDED_COLLECTIONS", "").split(",") if c]
+
+# Small client for counts and shard planning. The readers' pool is sized
+# once the number of sources is known (see SHARD PLAN below).
+setup_client = MongoClient(MONGO_URI)
+setup_db = setup_client[DB_NAME]
 
 
 # ----------------------------------------------------
 # PRINT COUNTS
 # ----------------------------------------------------
 def print_counts():
+    counts = {}
     print("\n--- MongoDB Document Counts ---")
     for c in TARGET_COLLECTIONS:
-        count = db[c].count_documents({})
-        print(f"{c}: {count}")
+        counts[c] = setup_db[c].estimated_document_count()
+        print(f"{c}: {counts[c]}")
     print("--------------------------------\n")
+    return counts
 
-print_counts()
+doc_counts = print_counts()
 
 
 # ----------------------------------------------------
 # SCHEMA
 # ----------------------------------------------------
 class DocSchema(pw.Schema):
-    doc_id: str
+    doc_id: str = pw.column_definition(primary_key=True)
     collection: str
     text: str
     version: str   # IMPORTANT: forces update detection
 
 
 # ----------------------------------------------------
-# TEXT BUILDER
+# VERSION HASH FOR CHANGE DETECTION
 # ----------------------------------------------------
-def build_text(collection, doc):
-
-    if collection == "doctors":
-        return " ".join(filter(None, [
-            f"Doctor: {doc.get('name','')}",
-            f"Speciality: {doc.get('speciality','')}",
-            f"About: {doc.get('about','')}",
-            "Languages: " + ", ".join(doc.get("languagesKnown", [])),
-            "Insurances: " + ", ".join(doc.get("acceptedInsurances", [])),
-        ]))
-
-    if collection == "hospitals":
-        return f"Hospital: {doc.get('name','')} {doc.get('location','')} Services: {doc.get('services','')}"
-
-    if collection == "appointments":
-        return f"Appointment with {doc.get('doctorName','')} on {doc.get('date','')} at {doc.get('time','')}"
-
-    if collection == "insurances":
-        return f"Insurance: {doc.get('provider','')} coverage: {doc.get('coverage','')}"
-
-    if collection == "medicalreports":
-        return f"Medical report for {doc.get('patientName','')} - {doc.get('type','')} Results: {doc.get('results','')}"
-
-    if collection == "reviews":
-        return f"Review by {doc.get('user','')} for {doc.get('doctor','')}: {doc.get('content','')}"
-
-    if collection == "symptomhistories":
-        return f"Symptoms: {doc.get('symptoms','')} Diagnosis: {doc.get('diagnosis','')}"
-
-    if collection == "users":
-        return f"User {doc.get('name','')} email {doc.get('email','')} role {doc.get('role','')}"
-
-    return str(doc)
+def doc_hash(d):
+    # default=str handles ObjectId / datetime values
+    return hashlib.md5(json.dumps(d, sort_keys=True, default=str).encode()).hexdigest()
 
 
 # ----------------------------------------------------
-# VERSION HASH FOR CHANGE DETECTION
+# SHARDING BY _id RANGE
 # ----------------------------------------------------
-def doc_hash(d):
-    return hashlib.md5(json.dumps(d, sort_keys=True).encode()).hexdigest()
+def should_shard(collection_name, count):
+    if SHARDED_COLLECTIONS:
+        return collection_name in SHARDED_COLLECTIONS
+    return count >= SHARD_MIN_DOCS
+
+
+def collection_shards(collection_name, count):
+    """
+    One Mongo filter per reader. Heavy collections are split into
+    SHARD_COUNT ObjectId ranges balanced by document count, plus one
+    shard for non-ObjectId keys (see mongo_shards.py).
+    """
+    if SHARD_COUNT < 2 or not should_shard(collection_name, count):
+        return [{}]
+    return shard_filters(setup_db[collection_name], SHARD_COUNT)
 
 
 # ----------------------------------------------------
 # FETCH
 # ----------------------------------------------------
-def fetch_rows(collection_name):
-    col = db[collection_name]
-    rows = []
-    for d in col.find({}):
-
-        rows.append({
+def fetch_rows(collection_name, shard_filter=None):
+    """
+    Stream rows for one collection (or one _id shard of it) using a
+    batched cursor and a projection limited to the text fields.
+    """
+    cursor = db[collection_name].find(
+        shard_filter or {},
+        projection_for(collection_name),
+        batch_size=MONGO_BATCH_SIZE,
+    )
+    for d in cursor:
+        yield {
             "doc_id": str(d["_id"]),
             "collection": collection_name,
             "text": build_text(collection_name, d),
-            "version": doc_hash(d),  # CHANGES ONLY IF THE DOCUMENT CHANGES
-        })
-
-    return rows
+            "version": doc_hash(d),  # CHANGES ONLY IF THE INDEXED FIELDS CHANGE
+        }
 
 
 # ----------------------------------------------------
 # EMBEDDINGS
 # ----------------------------------------------------
+torch.set_num_threads(TORCH_THREADS)
 embedder = SentenceTransformer(EMBED_MODEL)
 EMBED_DIM = embedder.get_sentence_embedding_dimension()
 
@@ -146,22 +153,63 @@ def embed(text: str):
 # CONTINUOUS STREAM CONNECTOR
 # ----------------------------------------------------
 class MongoSnapshotSource(pw.io.python.ConnectorSubject):
-    def __init__(self, collection_name):
+    def __init__(self, collection_name, shard_filter=None, label=None):
         super().__init__()
         self.collection_name = collection_name
+        self.shard_filter = shard_filter
+        self.label = label or collection_name
+        self.seen = {}   # doc_id -> row last sent to Pathway
+
+    def retract(self, row):
+        # key=None: Pathway derives the key from the doc_id primary key
+        self._remove(None, json.dumps(row, ensure_ascii=False).encode())
 
     def run(self):
         while True:
-            rows = fetch_rows(self.collection_name)
+            started = time.time()
+            live = set()
+            changed = 0
 
-            print(f"[Pathway] Reloaded {self.collection_name}: {len(rows)} rows")
+            for r in fetch_rows(self.collection_name, self.shard_filter):
+                live.add(r["doc_id"])
+                old = self.seen.get(r["doc_id"])
+                # only push new or modified documents
+                if old is None or old["version"] != r["version"]:
+                    if old is not None:
+                        self.retract(old)
+                    self.seen[r["doc_id"]] = r
+                    self.next(**r)
+                    changed += 1
 
-            for r in rows:
-                r["_pw_status"] = "update"
-                yield r
+            gone = self.seen.keys() - live
+            for doc_id in gone:
+                self.retract(self.seen.pop(doc_id))
 
-            yield pw.PwContinue()
-            pw.sleep(POLL_INTERVAL / 1000.0)
+            self.commit()
+            elapsed = time.time() - started
+            print(f"[Pathway] Reloaded {self.label}: {len(live)} rows ({changed} changed, {len(gone)} deleted) "
+                  f"in {elapsed:.1f}s ({len(live) / max(elapsed, 1e-6):.0f} docs/s)")
+
+            time.sleep(POLL_INTERVAL / 1000.0)
+
+
+# ----------------------------------------------------
+# SHARD PLAN + READER POOL
+# ----------------------------------------------------
+shard_plan = {c: collection_shards(c, doc_counts.get(c, 0)) for c in TARGET_COLLECTIONS}
+source_count = sum(len(shards) for shards in shard_plan.values())
+
+# One pooled client shared by every source / shard, with a connection
+# available for each source so shards never queue for one
+mongo_client = MongoClient(
+    MONGO_URI,
+    maxPoolSize=max(MONGO_POOL_SIZE, source_count),
+    minPoolSize=source_count,
+    maxIdleTimeMS=60000,
+    compressors="zlib",
+)
+db = mongo_client[DB_NAME]
+setup_client.close()
 
 
 # ----------------------------------------------------
@@ -169,44 +217,38 @@ class MongoSnapshotSource(pw.io.python.ConnectorSubject):
 # ----------------------------------------------------
 tables = []
 
-print("Loading tables from MongoDB...\n")
-
-for c in TARGET_COLLECTIONS:
-    print(f" → Loading collection: {c}")
-    source = MongoSnapshotSource(c)
-
-    t = pw.io.python.read(
-        source,
-        schema=DocSchema,
-        autocommit_duration_ms=POLL_INTERVAL,
-    ).select(
-        doc_id=pw.this.doc_id,
-        collection=pw.this.collection,
-        text=pw.this.text,
-        version=pw.this.version,
-        embedding=embed(pw.this.text),
-    )
+print(f"Loading tables from MongoDB ({source_count} sources)...\n")
 
-    tables.append(t)
+for c, shards in shard_plan.items():
+    print(f" → Loading collection: {c} ({len(shards)} shard(s))")
 
-print(f"\nTotal tables loaded: {len(tables)}\n")
+    for i, shard_filter in enumerate(shards):
+        label = c if len(shards) == 1 else f"{c}[{i + 1}/{len(shards)}]"
+        source = MongoSnapshotSource(c, shard_filter, label)
 
+        t = pw.io.python.read(
+            source,
+            schema=DocSchema,
+            autocommit_duration_ms=POLL_INTERVAL,
+        ).select(
+            doc_id=pw.this.doc_id,
+            collection=pw.this.collection,
+            text=pw.this.text,
+            version=pw.this.version,
+            embedding=embed(pw.this.text),
+        )
 
-# ----------------------------------------------------
-# SAFE CONCAT
-# ----------------------------------------------------
-print("Ensuring disjoint universes for concat...")
+        tables.append(t)
 
-safe_tables = []
-for i in range(len(tables)):
-    t = tables[i]
-    for j in range(i):
-        t = t.promise_universes_are_disjoint(safe_tables[j])
-    safe_tables.append(t)
+print(f"\nTotal tables loaded: {len(tables)}\n")
 
-docs = pw.Table.concat(*safe_tables)
 
-print("Universe check complete.\n")
+# ----------------------------------------------------
+# CONCAT
+# ----------------------------------------------------
+# concat_reindex assigns fresh row keys, so no pairwise
+# promise_universes_are_disjoint() chain is needed.
+docs = pw.Table.concat_reindex(*tables)
 
 
 # ----------------------------------------------------
@@ -215,9 +257,8 @@ print("Universe check complete.\n")
 print(f"Writing Pathway output to {OUTPUT_PATH} ...")
 pw.io.jsonlines.write(docs, OUTPUT_PATH)
 
-print("\n▶ Pathway is now watching MongoDB for changes...\n")
+print(f"\n▶ Pathway is now watching MongoDB for changes ({os.environ['PATHWAY_THREADS']} worker thread(s))...\n")
 pw.run()
 
-import time
 while True:
     time.sleep(999)
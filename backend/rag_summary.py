@@ -2,6 +2,7 @@
 import os
 import sys
 from pymongo import MongoClient
+from bson.objectid import ObjectId
 from sentence_transformers import SentenceTransformer
 import numpy as np
 
@@ -11,6 +12,8 @@ sys.path.append(os.path.dirname(__file__))
 
 import pathway_connector_pathway as connector
 from llm_client import call_llm_chat
+from doc_text import build_text
+from embedding_store import LiveIndex
 # --------------------------------------------------------------------
 
 # MongoDB connection
@@ -25,10 +28,43 @@ docs_col = db["documents"]
 EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 embedder = SentenceTransformer(EMBED_MODEL)
 
+# Generation built by backfill_embeddings.py (hot-swapped when CURRENT changes).
+# Reuses `embedder` when the generation was built with the same model.
+live_index = LiveIndex(models={EMBED_MODEL: embedder}).start()
+
+# Only these collections are used as evidence in the prompt. users and
+# appointments hold personal data, and medical reports belong to other patients.
+RAG_COLLECTIONS = ["doctors", "hospitals", "symptomhistories"]
+
+
+def retrieve_from_generation(symptoms: str, k: int):
+    hits = live_index.search(symptoms, k, collections=RAG_COLLECTIONS)
+
+    # one $in query per collection instead of a find_one per hit
+    by_collection = {}
+    for collection, doc_id, score in hits:
+        key = ObjectId(doc_id) if ObjectId.is_valid(doc_id) else doc_id
+        by_collection.setdefault(collection, []).append(key)
+
+    found = {}
+    for collection, keys in by_collection.items():
+        for doc in db[collection].find({"_id": {"$in": keys}}):
+            found[(collection, str(doc["_id"]))] = doc
+
+    # keep the score order from the index
+    docs = []
+    for collection, doc_id, score in hits:
+        doc = found.get((collection, doc_id))
+        if doc:
+            docs.append({"_id": doc["_id"], "title": collection, "text": build_text(collection, doc)})
+    return docs
+
 
 def retrieve_top_k(symptoms: str, k: int = 3):
     """
-    Use local FAISS index first. If empty, fallback to a naive text search.
+    Use the live local FAISS index first. The backfilled generation is a
+    fixed snapshot, so it is only used while no live index exists.
+    If both are empty, fallback to a naive text search.
     Returns list of docs.
     """
     if connector.faiss_index is not None and connector.faiss_index.ntotal > 0:
@@ -44,6 +80,10 @@ def retrieve_top_k(symptoms: str, k: int = 3):
                     doc = docs_col.find_one()
                 docs.append(doc or {"title": "unknown", "text": ""})
         return docs
+
+    docs = retrieve_from_generation(symptoms, k)
+    if docs:
+        return docs
     else:
         # fallback: naive text search (requires text index in Mongo)
         try:
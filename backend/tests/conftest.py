@@ -0,0 +1,6 @@
+# backend/tests/conftest.py
+import os
+import sys
+
+# make backend modules importable when running `python -m pytest backend/tests`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
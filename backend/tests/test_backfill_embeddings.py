@@ -0,0 +1,73 @@
+# backend/tests/test_backfill_embeddings.py
+import os
+from datetime import datetime
+
+import pytest
+from bson.objectid import ObjectId
+
+import backfill_embeddings as backfill
+import embedding_store as store
+
+
+@pytest.mark.parametrize("value", [
+    ObjectId(),
+    123,
+    2.5,
+    "legacy-id",
+    datetime(2024, 1, 2, 3, 4, 5),
+])
+def test_id_round_trip_keeps_type(value):
+    decoded = backfill.decode_id(backfill.encode_id(value))
+    assert decoded == value
+    assert type(decoded) is type(value)
+
+
+def test_resume_after_number_still_reads_later_types():
+    q = backfill.resume_filter(123)
+    gt, later = q["$or"]
+    assert gt == {"_id": {"$gt": 123}}
+    assert "string" in later["_id"]["$type"]
+    assert "objectId" in later["_id"]["$type"]
+    assert "int" not in later["_id"]["$type"]
+
+
+def test_resume_after_objectid_skips_earlier_types():
+    later = backfill.resume_filter(ObjectId())["$or"][1]["_id"]["$type"]
+    assert "string" not in later
+    assert "objectId" not in later
+    assert later[0] == "bool"
+
+
+def test_resume_refuses_unknown_id_types():
+    with pytest.raises(ValueError):
+        backfill.resume_filter(object())
+
+
+class RecordingCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.query = None
+
+    def find(self, query, projection=None, batch_size=None):
+        self.query = query
+        return self
+
+    def sort(self, key, direction):
+        return iter(self.docs)
+
+
+def test_checkpoint_resume_continues_after_last_id(tmp_path):
+    gen_dir = str(tmp_path)
+    store.write_json_atomic(os.path.join(gen_dir, "checkpoint.json"), {
+        "reviews": {"last_id": backfill.encode_id(42), "parts": 3, "docs": 30, "done": False},
+    })
+
+    ckpt = backfill.load_checkpoint(gen_dir, ["reviews", "users"])
+    assert ckpt["reviews"]["parts"] == 3
+    assert ckpt["users"] == {"last_id": None, "parts": 0, "docs": 0, "done": False}
+
+    col = RecordingCollection([{"_id": 43, "user": "a", "doctor": "b", "content": "ok"}])
+    batches = list(backfill.read_batches(col, "reviews", ckpt["reviews"]["last_id"], 10))
+
+    assert col.query == backfill.resume_filter(42)
+    assert batches == [(["43"], ["Review by a for b: ok"], 43)]
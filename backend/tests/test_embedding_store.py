@@ -0,0 +1,110 @@
+# backend/tests/test_embedding_store.py
+import os
+
+import numpy as np
+import pytest
+
+import embedding_store as store
+
+
+class FakeModel:
+    def encode(self, texts, convert_to_numpy=True):
+        return np.ones((len(texts), 2), dtype="float32")
+
+
+class FakeIndex:
+    """Returns positions 0..k-1 with descending scores."""
+
+    def __init__(self, n):
+        self.ntotal = n
+
+    def search(self, q, k):
+        return np.array([[1.0 - i / 100 for i in range(k)]]), np.array([list(range(k))])
+
+
+def make_generation(base_dir, name, model="fake-model"):
+    gen_dir = store.generation_dir(name, base_dir)
+    os.makedirs(gen_dir)
+    store.write_json_atomic(os.path.join(gen_dir, "manifest.json"), {"model": model})
+    open(os.path.join(gen_dir, "index.faiss"), "w").close()
+
+
+@pytest.fixture
+def generations(tmp_path, monkeypatch):
+    loaded = {}
+
+    def fake_load(generation, base_dir):
+        if generation not in loaded:
+            raise FileNotFoundError(generation)
+        return {"model": "fake-model"}, FakeIndex(len(loaded[generation])), loaded[generation]
+
+    monkeypatch.setattr(store, "load_generation", fake_load)
+    return str(tmp_path), loaded
+
+
+def test_activate_requires_a_finished_generation(tmp_path):
+    base = str(tmp_path)
+    os.makedirs(store.generation_dir("half", base))
+    with pytest.raises(ValueError):
+        store.activate("half", base)
+    assert store.current_generation(base) is None
+
+    make_generation(base, "g1")
+    store.activate("g1", base)
+    assert store.current_generation(base) == "g1"
+
+
+def test_live_index_swaps_to_new_generation(generations):
+    base, loaded = generations
+    loaded["g1"] = [["doctors", "a"]]
+    loaded["g2"] = [["doctors", "b"], ["hospitals", "c"]]
+    make_generation(base, "g1")
+    make_generation(base, "g2")
+
+    live = store.LiveIndex(base, models={"fake-model": FakeModel()})
+    store.activate("g1", base)
+    live.refresh()
+    assert [h[1] for h in live.search("q", 1)] == ["a"]
+
+    store.activate("g2", base)
+    live.refresh()
+    assert live.state[0] == "g2"
+    assert [h[1] for h in live.search("q", 2)] == ["b", "c"]
+
+
+def test_live_index_keeps_serving_when_a_load_fails(generations):
+    base, loaded = generations
+    loaded["g1"] = [["doctors", "a"]]
+    make_generation(base, "g1")
+    make_generation(base, "broken")
+
+    live = store.LiveIndex(base, models={"fake-model": FakeModel()})
+    store.activate("g1", base)
+    live._safe_refresh()
+
+    store.activate("broken", base)
+    live._safe_refresh()   # must not raise
+    assert live.state[0] == "g1"
+    assert live.search("q", 1)[0][1] == "a"
+
+
+def test_start_survives_a_broken_current(generations):
+    base, _ = generations
+    make_generation(base, "missing")
+    store.activate("missing", base)
+
+    live = store.LiveIndex(base, poll_seconds=3600).start()
+    assert live.state is None
+    assert live.search("q", 3) == []
+
+
+def test_search_filters_collections(generations):
+    base, loaded = generations
+    loaded["g1"] = [["users", str(i)] for i in range(50)] + [["doctors", "d1"], ["doctors", "d2"]]
+    make_generation(base, "g1")
+    store.activate("g1", base)
+
+    live = store.LiveIndex(base, models={"fake-model": FakeModel()})
+    live.refresh()
+    hits = live.search("q", 2, collections=["doctors"])
+    assert [(c, d) for c, d, _ in hits] == [("doctors", "d1"), ("doctors", "d2")]
@@ -0,0 +1,94 @@
+# backend/tests/test_mongo_shards.py
+from bson.objectid import ObjectId
+
+from mongo_shards import range_filters, shard_filters, split_points
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction):
+        self.docs = sorted(self.docs, key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def skip(self, n):
+        self.docs = self.docs[n:]
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class FakeCollection:
+    """Only understands the {"_id": {"$type": "objectId"}} filter used by split_points."""
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def _oids(self):
+        return [{"_id": i} for i in self.ids if isinstance(i, ObjectId)]
+
+    def count_documents(self, query):
+        return len(self._oids())
+
+    def find(self, query, projection=None):
+        return FakeCursor(self._oids())
+
+
+def matches(_id, flt):
+    """Evaluate the filter shapes range_filters() produces."""
+    if not flt:
+        return True
+    cond = flt["_id"]
+    if "$not" in cond:
+        return not isinstance(_id, ObjectId)
+    if not isinstance(_id, ObjectId):
+        return False
+    if "$gte" in cond and not _id >= cond["$gte"]:
+        return False
+    if "$lt" in cond and not _id < cond["$lt"]:
+        return False
+    return True
+
+
+def make_ids(n):
+    # ObjectIds in increasing _id order
+    return [ObjectId(f"{1700000000 + i:08x}" + "0" * 16) for i in range(n)]
+
+
+def test_every_id_lands_in_exactly_one_shard():
+    ids = make_ids(103) + [1, 2, "legacy-id", 3.5]
+    filters = shard_filters(FakeCollection(ids), 4)
+
+    assert len(filters) == 5
+    for _id in ids:
+        assert sum(matches(_id, f) for f in filters) == 1, _id
+
+
+def test_shards_are_balanced_by_count():
+    ids = make_ids(1000)
+    filters = shard_filters(FakeCollection(ids), 4)
+
+    sizes = [sum(matches(_id, f) for _id in ids) for f in filters[:-1]]
+    assert sizes == [250, 250, 250, 250]
+
+
+def test_non_objectid_shard_is_last():
+    filters = range_filters(make_ids(2))
+    assert filters[-1] == {"_id": {"$not": {"$type": "objectId"}}}
+    assert all(f["_id"]["$type"] == "objectId" for f in filters[:-1])
+
+
+def test_shard_count_is_fixed_without_objectids():
+    cuts = split_points(FakeCollection([1, 2, 3]), 4)
+    assert len(cuts) == 3
+    assert len(range_filters(cuts)) == 5
+
+
+def test_single_shard_reads_everything():
+    assert shard_filters(FakeCollection(make_ids(10)), 1) == [{}]